@@ -8,23 +8,57 @@ Description:  Data file handling for historical gdax data
 
 from __future__ import absolute_import
 
+import os
 import pathlib
-import time
+import datetime
 import logging
 import aiohttp
 import asyncio
+import collections
 import configparser
 
-from dateutil.tz import tzutc
 from dateutil.parser import parse
 
 import gdax
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.dataset
+import pyarrow.fs
 
 from blockhead.util import to_utc
 
+# column types of the cached bar files, timestamps are read as strings and converted by pandas, since older
+# cache files were written without a utc offset
+BAR_COLUMN_TYPES = {'open_time': pa.string(),
+                    'low': pa.float64(),
+                    'high': pa.float64(),
+                    'open': pa.float64(),
+                    'close': pa.float64(),
+                    'volume': pa.float64(),
+                    'close_time': pa.string()}
+
+# bar timestamps are converted to one resolution whatever they were read
+# from, so csv, parquet and fetched bars concatenate without casting
+BAR_TIME_DTYPE = 'datetime64[ns, UTC]'
+
+# candles are public, so without a client only the api url and a timeout
+# are needed, not a Trader and its session
+PublicClient = collections.namedtuple('PublicClient', 'API_URL timeout_sec')
+PUBLIC_CLIENT = PublicClient(API_URL=gdax.trader.Trader.API_URL, timeout_sec=10)
+
+# session shared by candle requests and the loop it belongs to, see get_session
+_SESSION = None
+_SESSION_LOOP = None
+
+# keys and urls from a config file
+GDAXConfig = collections.namedtuple('GDAXConfig',
+                                    'api_key api_secret api_passphrase api url')
+
 def parse_config(config):
-    """ parses the data from a config, return info """
+    """ parses the data from a config, returns a GDAXConfig """
     cparser = configparser.ConfigParser()
     cparser.read_file(config)
     try:
@@ -33,18 +67,18 @@ def parse_config(config):
         api_passphrase = cparser['keys']['passphrase']
         api = cparser['uris']['api']
         url = cparser['uris']['wsapi']
-        return dict(api_key=api_key,
-                    api_secret=api_secret,
-                    api_passphrase=api_passphrase,
-                    api=api,
-                    url=url)
+        return GDAXConfig(api_key=api_key,
+                          api_secret=api_secret,
+                          api_passphrase=api_passphrase,
+                          api=api,
+                          url=url)
     except KeyError as kerr:
         logging.error(kerr)
         raise kerr
 
 
 def get_bars(pair, start, end, interval,
-                   directory='output', client=None):
+                   directory='output', client=None, assume_utc=False):
     """ fetches bars from the cache, and if missing gets
     them from gdax and stores them. Assumes that the passed in
     start/end times are in local time, will convert them to UTC.
@@ -55,6 +89,7 @@ def get_bars(pair, start, end, interval,
     interval -- the bar interval in seconds
     directory -- the cache directory
     client -- the gdax client to use to fetch bars if needed
+    assume_utc -- offset-naive start and end are in utc, not local time
     """
 
     if isinstance(start, str):
@@ -63,81 +98,162 @@ def get_bars(pair, start, end, interval,
         end = parse(end)
 
     # convert start and end to UTC
-    start = to_utc(start)
-    end = to_utc(end)
+    start = to_utc(start, assume_utc)
+    end = to_utc(end, assume_utc)
 
-    # get date range
-    dates = pd.date_range(start, end, tz='UTC')
-    # iterate through dates and build up all the bars
+    # iterate through the utc dates and build up all the bars
+    first_date = start.date()
+    days = (end.date() - first_date).days + 1
     path = pathlib.Path(directory, pair, str(interval))
+    # list the cache once instead of checking each day's files
+    try:
+        existing = {entry.name for entry in os.scandir(str(path))}
+    except FileNotFoundError:
+        existing = set()
     all_bars = []
-    def date_utc(col):
-        """ UTC date parser for bars """
-        return parse(col, tzinfos=tzutc)
-
-    for date in dates:
-        barfile = path / date.strftime('%Y-%m-%d')
-        if barfile.exists():
-            logging.debug("loading existing bars for %s", date)
-            bars = pd.read_csv(barfile.open('r'),
-                               parse_dates=[0, 6],
-                               index_col=6,
-                               date_parser=date_utc)
-            bars['close_time'] = bars.index
-            all_bars.append(bars)
+    parquet_files = []
+    for offset in range(days):
+        date = first_date + datetime.timedelta(days=offset)
+        label = date.isoformat()
+        # prefer parquet, older caches were written as csv
+        if label + '.parquet' in existing:
+            parquet_files.append(str(path / (label + '.parquet')))
+        elif label in existing:
+            logging.debug("loading existing csv bars for %s", date)
+            all_bars.append(read_bar_file(path / label))
 #        else:
 #            client = client or gdax.trader.Trader(product_id=pair)
 #            dstart = max(start, date.replace(hour=0, minute=0, second=0))
 #            dend = min(end, (date + pd.Timedelta('1d')).replace(hour=0, minute=0, second=0))
 #            all_bars.append(await fetch_bars(pair, dstart, dend, interval, client))
+    if parquet_files:
+        logging.debug("loading existing parquet bars for %s days", len(parquet_files))
+        all_bars.append(read_parquet_bars(parquet_files, start, end))
     if len(all_bars):
-        return pd.concat(all_bars)[start:end]
+        return pd.concat(all_bars, sort=False).sort_index()[start:end]
+
+def read_parquet_bars(barfiles, start, end):
+    """ reads cached parquet bar files as a single dataset, loading only
+    the bars that close between start and end, indexed by close_time in UTC
+    barfiles -- the paths of the files to read
+    start -- the earliest close time, in UTC
+    end -- the latest close time, in UTC
+    """
+    dataset = pa.dataset.dataset(barfiles, format='parquet',
+                                 filesystem=pa.fs.LocalFileSystem(use_mmap=True))
+    close_time = pa.dataset.field('close_time')
+    table = dataset.to_table(filter=(close_time >= start) & (close_time <= end))
+    bars = table.to_pandas(self_destruct=True)
+    return set_bar_times(bars)
 
-async def fetch_bars(pair, start, end, interval, client=None, batch=300):
+def set_bar_times(bars):
+    """ converts the open and close times to BAR_TIME_DTYPE and indexes
+    the bars by close_time, returns the bars
+    bars -- the frame to update in place
+    """
+    for col in ['open_time', 'close_time']:
+        bars[col] = bars[col].astype(BAR_TIME_DTYPE)
+    bars.index = bars['close_time']
+    return bars
+
+def read_bar_file(barfile):
+    """ reads one cached csv bar file, indexed by close_time in UTC
+    barfile -- the path of the file to read
+    """
+    with pa.memory_map(str(barfile), 'r') as source:
+        table = pa.csv.read_csv(source,
+                                read_options=pa.csv.ReadOptions(use_threads=True),
+                                convert_options=pa.csv.ConvertOptions(
+                                    column_types=BAR_COLUMN_TYPES))
+    bars = table.to_pandas()
+    for col in ['open_time', 'close_time']:
+        bars[col] = pd.to_datetime(bars[col], utc=True, cache=True)
+    return set_bar_times(bars)
+
+async def fetch_bars(pair, start, end, interval, client=None, batch=300,
+                     concurrency=4, assume_utc=False, min_interval=0.35):
     """ fetches bars from GDAX's public api
     pair -- the gdax currency pair
     start -- the start datetime
     end -- the end datetime
     interval -- the bar interval in seconds
-    client -- the gdax client to use to fetch bars if needed
+    client -- the gdax client whose api url and timeout are used,
+    PUBLIC_CLIENT by default
     batch -- the batch size to use for fetching
+    concurrency -- the maximum number of batches to request at once
+    assume_utc -- offset-naive start and end are in utc, not local time
+    min_interval -- the minimum seconds between the start of requests, gdax
+    allows 3 public requests per second
     """
     # convert start and end to UTC
-    start = to_utc(start)
-    end = to_utc(end)
+    start = to_utc(start, assume_utc)
+    end = to_utc(end, assume_utc)
+
+    client = client or PUBLIC_CLIENT
+
+    # work backwards from end_date to start_date by batch size
+    step = pd.Timedelta(seconds=int(interval)) * batch
+    windows = []
+    window_end = end
+    while window_end > start:
+        windows.append((max(start, window_end - step), window_end))
+        window_end -= step
+
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    next_start = loop.time()
+    async def fetch_window(window):
+        """ fetches one window, limiting the requests in flight and
+        spacing their starts by min_interval. Returns None if the
+        window was rate limited and should be retried """
+        nonlocal next_start
+        async with semaphore:
+            # claim the next start slot before sleeping until it
+            now = loop.time()
+            start_at = max(now, next_start)
+            next_start = start_at + min_interval
+            if start_at > now:
+                await asyncio.sleep(start_at - now)
+            try:
+                bars = await fetch_bar_batch(pair, window[0], window[1], interval, client)
+            except aiohttp.ClientResponseError as cre:
+                logging.error("request error: %s", cre)
+                if cre.status == 429:
+                    return None
+                raise
+        logging.debug("fetched %s bars from %s to %s", len(bars), *window)
+        return bars
 
-    full_start = start
-    full_end = end
-    client = client or gdax.trader.Trader(product_id=pair)
-    sleep_time = 0.5
     failures = 0
     all_bars = list()
-    complete = start
-    while end > complete:
-        # work backwards from end_date to start_date by batch size
+    while windows:
+        tasks = [asyncio.ensure_future(fetch_window(w)) for w in windows]
         try:
-            start = end - pd.Timedelta('%ss' % interval) * batch
-            bars = await fetch_bar_batch(pair, start, end, interval, client)
-        except aiohttp.ClientResponseError as err:
-            logging.error("request error: %s", err)
-            if err.code == 429:
-                failures += 1
-                sleep_time = 2 ** failures
-                logging.error("sleeping: %s", sleep_time)
-                time.sleep(sleep_time)
-                continue
+            results = await asyncio.gather(*tasks)
+        except Exception:
+            # any other error would leave a hole in the bars, so stop
+            # the remaining windows rather than return a partial range
+            for task in tasks:
+                task.cancel()
+            raise
+        retry = []
+        for window, res in zip(windows, results):
+            if res is None:
+                retry.append(window)
             else:
-                # let's at least save what we've already downloaded
-                break
-        logging.debug("fetched %s bars from %s to %s", len(bars), start, end)
-        all_bars.append(bars)
-        end = bars.index[0]
-        time.sleep(sleep_time)
-
-    all_bars.reverse() # since we went backward in blocks
+                all_bars.append(res)
+        if retry:
+            failures += 1
+            sleep_time = 2 ** failures
+            logging.error("sleeping: %s", sleep_time)
+            await asyncio.sleep(sleep_time)
+        windows = retry
+
     if len(all_bars):
-        bars = pd.concat(all_bars)
-        return bars[full_start:full_end]
+        bars = pd.concat(all_bars, sort=False).sort_index()
+        # adjacent windows share their boundary bar
+        bars = bars[~bars.index.duplicated()]
+        return bars[start:end]
 
 async def fetch_bar_batch(pair, start, end, interval, client=None):
     """ fetches one batch of bars from GDAX's public api
@@ -145,16 +261,16 @@ async def fetch_bar_batch(pair, start, end, interval, client=None):
     start -- the start datetime
     end -- the end datetime
     interval -- the bar interval in seconds
-    client -- the gdax client to use to fetch bars if needed
+    client -- the gdax client whose api url and timeout are used,
+    PUBLIC_CLIENT by default
     """
-    client = client or gdax.trader.Trader(product_id=pair)
+    client = client or PUBLIC_CLIENT
     attempts = 0
     max_attempts = 5
     while attempts <= max_attempts:
         try:
-            res = await client.get_product_historic_rates(start=start.strftime('%Y-%m-%dT%H:%M:%S'),
-                                                          end=end.strftime('%Y-%m-%dT%H:%M:%S'),
-                                                          granularity=interval)
+            res = await asyncio.wait_for(fetch_candles(pair, start, end, interval, client),
+                                         client.timeout_sec)
             break
         except asyncio.TimeoutError as toe:
             attempts += 1
@@ -165,13 +281,57 @@ async def fetch_bar_batch(pair, start, end, interval, client=None):
             logging.warning('Error fetching bars: %s - are you fetching too many at once?', cre)
             raise cre
 
-    bars = pd.DataFrame(res, columns=['open_time', 'low', 'high', 'open', 'close', 'volume'])
-    bars['open_time'] = pd.to_datetime(bars['open_time'], unit='s')
-    bars['close_time'] = bars['open_time'].shift()
-    first_close = bars.loc[bars.index[0], 'open_time'] + pd.Timedelta('%s' % interval)
-    bars.loc[bars.index[0], 'close_time'] = first_close
-    bars.index = bars['close_time']
-    bars = bars.tz_localize('UTC')
-    bars = bars.sort_index()
+    # rows are [time, low, high, open, close, volume], newest first, so
+    # reversing the view leaves them in time order without a sort
+    candles = np.asarray(res, dtype=np.float64).reshape(-1, 6)[::-1]
+    open_time = pd.to_datetime(candles[:, 0].astype(np.int64), unit='s', utc=True)
+    bars = pd.DataFrame(candles[:, 1:],
+                        columns=['low', 'high', 'open', 'close', 'volume'],
+                        copy=False)
+    bars.insert(0, 'open_time', open_time)
+    bars['close_time'] = open_time + pd.Timedelta(seconds=int(interval))
+    set_bar_times(bars)
 
     return bars
+
+def get_session():
+    """ returns the aiohttp session shared by all candle requests, so
+    batches reuse kept alive connections instead of new TLS handshakes.
+    A session is bound to its loop, so a new one is made for each
+    running loop, e.g. repeated calls to asyncio.run """
+    global _SESSION, _SESSION_LOOP
+    loop = asyncio.get_running_loop()
+    if _SESSION is None or _SESSION.closed or _SESSION_LOOP is not loop:
+        connector = aiohttp.TCPConnector(limit=8, ttl_dns_cache=300,
+                                         keepalive_timeout=60)
+        _SESSION = aiohttp.ClientSession(connector=connector)
+        _SESSION_LOOP = loop
+    return _SESSION
+
+async def close_session():
+    """ closes the shared candle session, call before the loop exits """
+    global _SESSION, _SESSION_LOOP
+    if _SESSION is not None and _SESSION_LOOP is asyncio.get_running_loop():
+        await _SESSION.close()
+    _SESSION = None
+    _SESSION_LOOP = None
+
+async def fetch_candles(pair, start, end, interval, client):
+    """ requests one batch of raw candles using the shared session. The
+    trader decodes responses with the json module and converts every value
+    to a Decimal, here the body is decoded once with orjson instead.
+    Returns rows of [time, low, high, open, close, volume]
+    pair -- the gdax currency pair
+    start -- the start datetime
+    end -- the end datetime
+    interval -- the bar interval in seconds
+    client -- the gdax client whose api url is used
+    """
+    # start and end are in utc, sent without an offset
+    params = {'start': start.replace(tzinfo=None).isoformat(timespec='seconds'),
+              'end': end.replace(tzinfo=None).isoformat(timespec='seconds'),
+              'granularity': interval}
+    url = '{}/products/{}/candles'.format(client.API_URL, pair)
+    async with get_session().get(url, params=params) as response:
+        response.raise_for_status()
+        return orjson.loads(await response.read())
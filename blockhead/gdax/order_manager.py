@@ -6,14 +6,42 @@ Github: https://github.com/wrighter
 Description:  Order management functions
 """
 
+import asyncio
 import logging
+import os
 import uuid
 
 from decimal import Decimal
-from collections import defaultdict
 
 from abc import ABC, abstractmethod
 
+from blockhead.util import to_units, from_units
+
+# fill change, in units, returned for order messages that aren't matches
+NO_FILL = 0
+
+class _OidPool:
+    """ Hands out random (version 4) uuid strings for client order ids,
+    generated in batches from a single os.urandom read """
+    BATCH = 128
+
+    def __init__(self):
+        self._oids = []
+
+    def refill(self):
+        """ generate another batch of ids """
+        raw = os.urandom(16 * self.BATCH)
+        self._oids = [str(uuid.UUID(bytes=raw[i:i + 16], version=4))
+                      for i in range(0, len(raw), 16)]
+
+    def next(self):
+        """ the next unused id """
+        if not self._oids:
+            self.refill()
+        return self._oids.pop()
+
+_OID_POOL = _OidPool()
+
 class Order:
     """ Base class to encapsulate an order on the exchange, and that 
     can track its current state when given all messages.
@@ -22,6 +50,10 @@ class Order:
     """
     FIVE_PLACES = Decimal(10) ** -5
 
+    __slots__ = ('size', 'pair', 'limit_price', 'total', 'placed',
+                 '_total_units', '_filled_units', 'state', 'omgr',
+                 'client_oid', 'order_id', 'details')
+
     def __init__(self, size, pair, omgr, limit_price=None):
         """ initialize with signed size """
         self.size = size
@@ -29,10 +61,12 @@ class Order:
         self.limit_price = limit_price
         self.total = abs(size)
         self.placed = Decimal(0)
-        self.filled = Decimal(0)
+        # sizes are tracked as integer units of 1e-8, gdax's size precision
+        self._total_units = to_units(self.total)
+        self._filled_units = 0
         self.state = 'initial'
         self.omgr = omgr
-        self.client_oid = str(uuid.uuid4())
+        self.client_oid = _OID_POOL.next()
         self.order_id = None
         self.details = dict()
 
@@ -40,14 +74,24 @@ class Order:
         """ standard string representation """
         return f'<Order size: {self.size}, lp: {self.limit_price}. p: {self.placed}, f: {self.filled}, s: {self.state}, id: {self.order_id}'
 
+    @property
+    def filled(self):
+        """ size filled so far """
+        return from_units(self._filled_units)
+
     def outstanding(self):
         """ outstanding size on the order """
-        return abs(self.size) - self.filled
+        return from_units(self.outstanding_units())
+
+    def outstanding_units(self):
+        """ outstanding size on the order, in integer units """
+        return self._total_units - self._filled_units
 
     def update(self, details):
         """ update our details dict with info from the feed """
         self.details.update(details)
-        logging.debug("Order: update - %s", self.details)
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("Order: update - %s", self.details)
 
     async def begin(self):
         """ tell the order to begin its process, using the
@@ -66,30 +110,55 @@ class Order:
     def handle_order_update(self, msg):
         """ callback to handle our updates, returns the net
         change in quantity from matches, or 0 if no change """
-        filled = Decimal(0)
+        return from_units(self.handle_order_units(msg))
+
+    def handle_order_units(self, msg):
+        """ handles our updates like handle_order_update, but returns
+        the net change in integer units """
         self.update(msg)
-        if msg['type'] == 'received':
-            logging.debug('Order received')
-            self.state = 'received'
-        elif msg['type'] == 'open':
-            logging.debug('Order went active')
-            self.state = 'open'
-        elif msg['type'] == 'match':
+        handler = self._HANDLERS.get(msg['type'])
+        if handler is None:
+            return NO_FILL
+        return handler(self, msg)
+
+    def _on_received(self, msg):
+        """ order was received by the exchange """
+        logging.debug('Order received')
+        self.state = 'received'
+        return NO_FILL
+
+    def _on_open(self, msg):
+        """ order is resting on the book """
+        logging.debug('Order went active')
+        self.state = 'open'
+        return NO_FILL
+
+    def _on_match(self, msg):
+        """ order was (partially) filled, returns the signed fill """
+        filled = to_units(msg['size'])
+        self._filled_units += filled
+        if logging.root.isEnabledFor(logging.DEBUG):
             logging.debug('Order matched')
-            filled = Decimal(msg['size'])
-            self.filled += filled
-            self.filled = self.filled.quantize(Order.FIVE_PLACES)
-            if self.filled == self.total:
+            if self._filled_units == self._total_units:
                 logging.debug('Order completed')
-            if msg['side'] == 'sell':
-                # want to return signed size for inventory tracking
-                # XXX refactor
-                filled = -filled
-        elif msg['type'] == 'done':
-            logging.debug('Order %s', msg['reason'])
-            self.state = 'done'
+        if msg['side'] == 'sell':
+            # want to return signed size for inventory tracking
+            # XXX refactor
+            filled = -filled
         return filled
 
+    def _on_done(self, msg):
+        """ order is filled or canceled """
+        logging.debug('Order %s', msg['reason'])
+        self.state = 'done'
+        return NO_FILL
+
+    # message type -> handler, returning the signed fill units
+    _HANDLERS = {'received': _on_received,
+                 'open': _on_open,
+                 'match': _on_match,
+                 'done': _on_done}
+
 class OrderManager(object):
     """
     Class to manage orders on GDAX. Using an authclient, will get initial
@@ -108,7 +177,8 @@ class OrderManager(object):
         self.pending_strategies = []
         self.strategies = []
         self.order_lookup = dict()
-        self.inventory = Decimal(0)
+        # kept in integer units, see the inventory property
+        self.inventory_units = 0
 
     async def init(self):
         """ async initialization """
@@ -124,16 +194,31 @@ class OrderManager(object):
         return strategy
 
     async def on_init(self, _):
-        """ when client has data, we can process pending orders """
-        for strat in self.pending_strategies:
-            await strat.init(self)
+        """ when client has data, we can process pending orders,
+        placing their initial orders concurrently """
+        pending = list(self.pending_strategies)
         self.pending_strategies.clear()
+        await asyncio.gather(*[strat.init(self) for strat in pending])
+
+    @property
+    def inventory(self):
+        """ the net size filled, as a Decimal """
+        return from_units(self.inventory_units)
+
+    @inventory.setter
+    def inventory(self, inventory):
+        self.inventory_units = to_units(inventory)
 
     def total_outstanding(self):
         """ return the total size outstanding by all strategies """
+        return from_units(self.total_outstanding_units())
+
+    def total_outstanding_units(self):
+        """ return the total size outstanding by all strategies,
+        in integer units """
         total = 0
         for strat in self.strategies:
-            total += strat.outstanding()
+            total += strat.outstanding_units()
         return total
 
     async def cancel_all(self):
@@ -197,14 +282,14 @@ class OrderManager(object):
 
     async def handle_order_update(self, msg):
         """ callback to handle all updates for our orders"""
-        for key in ['client_oid', 'order_id', 'maker_order_id', 'taker_order_id']:
-            if key in msg:
-                order = self.order_lookup.get(msg[key])
-                if order:
-                    filled = order.handle_order_update(msg)
-                    self.inventory += filled
-                    return
-        logging.error("Could not find matching order: %s", msg)
+        get = msg.get
+        lookup = self.order_lookup.get
+        order = (lookup(get('client_oid')) or lookup(get('order_id')) or
+                 lookup(get('maker_order_id')) or lookup(get('taker_order_id')))
+        if order is None:
+            logging.error("Could not find matching order: %s", msg)
+            return
+        self.inventory_units += order.handle_order_units(msg)
 
     async def update_orders(self):
         """
@@ -223,6 +308,8 @@ class OrderManager(object):
 
 class Strategy(ABC):
     """ Order handling strategy. Will place and modify orders """
+    __slots__ = ('name', 'omgr', 'initialized')
+
     def __init__(self, name):
         self.name = name
         self.omgr = None
@@ -236,6 +323,11 @@ class Strategy(ABC):
     def outstanding(self):
         pass
 
+    def outstanding_units(self):
+        """ outstanding size in integer units, strategies tracking an
+        order can override this to skip the Decimal """
+        return to_units(self.outstanding())
+
     @abstractmethod
     async def update_orders(self):
         pass
@@ -252,6 +344,8 @@ class Strategy(ABC):
         return order
 
 class SimpleStrategy(Strategy):
+    __slots__ = ('size', 'filled', 'order')
+
     def __init__(self, size):
         super().__init__("SimpleStrategy")
         self.size = size
@@ -269,6 +363,11 @@ class SimpleStrategy(Strategy):
             return self.order.outstanding()
         return 0
 
+    def outstanding_units(self):
+        if self.order is not None:
+            return self.order.outstanding_units()
+        return 0
+
     async def update_orders(self):
         """ do nothing, just leave orders there """
         if self.order is not None:
@@ -279,6 +378,8 @@ class SimpleStrategy(Strategy):
         return self.order and self.order.state == 'done'
 
 class FollowStrategy(Strategy):
+    __slots__ = ('size', 'remaining', 'filled', 'order')
+
     def __init__(self, size):
         super().__init__("FollowStrategy")
         self.size = size
@@ -297,6 +398,11 @@ class FollowStrategy(Strategy):
             return self.order.outstanding()
         return 0
 
+    def outstanding_units(self):
+        if self.order is not None:
+            return self.order.outstanding_units()
+        return 0
+
     async def update_orders(self):
         """ Look at top of book, move order to follow on update """
         # TODO partial fills
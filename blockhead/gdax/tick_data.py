@@ -9,55 +9,76 @@ Also uses message data and can calculate useful information
 such as bars with it.
 """
 
+import asyncio
 import datetime
+import inspect
 import logging
 
-from decimal import Decimal, MIN_EMIN, MAX_EMAX
 from collections import defaultdict
 
 from blockhead.gdax.data import parse_config, fetch_bars
+from blockhead.util import to_units
 from gdax.trader import Trader
 from gdax.orderbook import OrderBook
 
+# volume is accumulated in integer units of 1e-8, gdax's size precision.
+# Dividing by the exact power of ten rounds correctly, multiplying by
+# 1e-8 can be off by an ulp
+VOLUME_UNITS = 10 ** 8
+
 class Bar(object):
     """ Turns ticks in to bars """
+    __slots__ = ('high_price', 'low_price', 'open_price', 'close_price',
+                 'prev_close_price', 'volume')
+
     def __init__(self):
-        self.high_price = MIN_EMIN
-        self.low_price = MAX_EMAX
+        self.high_price = float('-inf')
+        self.low_price = float('inf')
         self.open_price = None
         self.close_price = None
         self.prev_close_price = None
-        self.volume = Decimal(0)
+        self.volume = 0
 
     def handle_close(self, close, size):
-        """ canonical bar close processing """
+        """ canonical bar close processing
+        close -- the trade price, as a float
+        size -- the trade size, in integer units """
         if close is None:
             return
         self.close_price = close
-        if self.close_price > self.high_price:
-            self.high_price = self.close_price
-        if self.close_price < self.low_price:
-            self.low_price = self.close_price
+        if close > self.high_price:
+            self.high_price = close
+        if close < self.low_price:
+            self.low_price = close
         if self.open_price is None:
-            self.open_price = self.close_price
+            self.open_price = close
         self.volume += size
 
     def get_bar(self):
         """ close and return the current bar """
         if self.close_price is None:
             self.close_price = self.prev_close_price
-        if self.high_price == MIN_EMIN:
+        if self.high_price == float('-inf'):
             self.high_price = self.close_price
-        if self.low_price == MAX_EMAX:
+        if self.low_price == float('inf'):
             self.low_price = self.close_price
         last_bar = {'open': self.open_price,
                     'high': self.high_price,
                     'low': self.low_price,
                     'close': self.close_price,
-                    'volume': self.volume}
+                    'volume': self.volume / VOLUME_UNITS}
         self.prev_close_price = self.close_price
         return last_bar
 
+async def _notify(callbacks, arg):
+    """ calls each callback with arg, then awaits whatever they returned
+    that is awaitable concurrently. Checking the result rather than the
+    callback also handles partials and lambdas wrapping coroutines """
+    pending = [res for res in (cback(arg) for cback in callbacks)
+               if inspect.isawaitable(res)]
+    if pending:
+        await asyncio.gather(*pending)
+
 class TickData(object):
     """ TickData will allow for clients to obtain messages and
     process them after they are saved in the OrderBook """
@@ -66,9 +87,9 @@ class TickData(object):
 
         cfg = parse_config(config)
         self.product_id = product_id
-        self.api_key = cfg['api_key']
-        self.api_secret = cfg['api_secret']
-        self.passphrase = cfg['api_passphrase']
+        self.api_key = cfg.api_key
+        self.api_secret = cfg.api_secret
+        self.passphrase = cfg.api_passphrase
         self.timeout_sec = timeout_sec
         self.trade_log_file_path = trade_log_file_path
         self.authtrader = Trader(#product_id=self.product_id,
@@ -121,7 +142,7 @@ class TickData(object):
             logging.debug("TickData is initialized")
         if msg['type'] == 'match':
             # bar processing
-            self.current_bar.handle_close(Decimal(msg['price']), Decimal(msg['size']))
+            self.current_bar.handle_close(float(msg['price']), to_units(msg['size']))
         if 'user_id' in msg:
             await self.notify_order_listeners(msg)
         return msg
@@ -155,17 +176,15 @@ class TickData(object):
 
     async def notify_order_listeners(self, msg):
         """ notify the order listeners of the order updates """
-        for cback in self.order_callbacks:
-            await cback(msg)
+        await _notify(self.order_callbacks, msg)
 
     def add_listener(self, cback, event):
         """ adds this listener to the event callbacks """
         self.event_listeners[event].append(cback)
 
     async def notify_listeners(self, event):
-        """ notify all listeners  of the event """
-        for cback in self.event_listeners.get(event, []):
-            await cback(event)
+        """ notify all listeners of the event """
+        await _notify(self.event_listeners.get(event, ()), event)
 
     async def get_bars(self, pair, qty, granularity=60, end=None):
         """ get qty granularity second bars for pair
@@ -176,4 +195,5 @@ class TickData(object):
         end = end or datetime.datetime.utcnow()
         start = end - datetime.timedelta(seconds=qty * granularity)
         return await fetch_bars(pair, start, end, granularity,
-                                client=self.authtrader, batch=min(300,qty))
+                                client=self.authtrader, batch=min(300,qty),
+                                assume_utc=True)
@@ -7,7 +7,7 @@ from __future__ import absolute_import
 
 import logging
 import datetime
-import configparser
+import functools
 
 from gdax.websocket_feed_listener import WebsocketFeedListener
 from gdax.trader import Trader
@@ -15,20 +15,53 @@ from gdax.trader import Trader
 from . import data
 
 import pandas as pd
-from bintrees import RBTree
-from decimal import Decimal, MIN_EMIN, MAX_EMAX
+from sortedcontainers import SortedDict
+from decimal import Decimal
 from collections import defaultdict
 
+from blockhead.util import to_units, from_units
+
+def increment_places(increment):
+    """ number of decimal places in a product increment, e.g. 2 for
+    a quote_increment of '0.01' """
+    return max(0, -Decimal(increment).normalize().as_tuple().exponent)
+
+def price_parser(places):
+    """ parser of prices in to ticks with this many decimal places.
+    Prices cluster on a small set of levels, so the parsed strings are
+    cached rather than re-parsed on every message. """
+    return functools.lru_cache(maxsize=4096)(functools.partial(to_units,
+                                                                places=places))
+
+class PriceLevel(object):
+    """ The orders resting at one price in the book, in time priority.
+    A dict keeps insertion order, so the head of the queue is the first
+    key, and orders can be removed or resized by id without a scan. """
+    __slots__ = ('orders', 'size')
+
+    def __init__(self):
+        self.orders = dict()
+        self.size = 0
+
 class GDAXWebsocketClient(WebsocketFeedListener):
 
     def __init__(self, config, products, auth, channels, should_print=False):
         super(GDAXWebsocketClient, self).__init__(products=products,
                 auth=auth, channels=channels, should_print=should_print)
-        self.config = self.parse_config(config)
+        self.config = data.parse_config(config)
+        (self.api_key, self.api_secret, self.api_passphrase,
+         self.api, self.url) = self.config
         self.authclient = AuthenticatedClient(self.api_key,
                 self.api_secret, self.api_passphrase, self.api)
-        self._asks = RBTree()
-        self._bids = RBTree()
+        self._asks = SortedDict()
+        self._bids = SortedDict()
+        self._order_index = dict()
+        # prices and sizes are kept as integer ticks of the product's
+        # increments, refined from the product details on reset_book
+        self._price_places = 8
+        self._size_places = 8
+        self._price_ticks = price_parser(self._price_places)
+        self._increments_known = False
         self._sequence = -1
         self._current_ticker = None
         self.order_callbacks = list()
@@ -37,20 +70,6 @@ class GDAXWebsocketClient(WebsocketFeedListener):
         self.observed_orders = set()
         self.event_listeners = defaultdict(list)
 
-    def parse_config(self, config):
-        """ parses the data from the config """
-        cparser = configparser.ConfigParser()
-        cparser.read_file(config)
-        try:
-            self.api_key = cparser['keys']['key']
-            self.api_secret = cparser['keys']['secret']
-            self.api_passphrase = cparser['keys']['passphrase']
-            self.api = cparser['uris']['api']
-            self.url = cparser['uris']['wsapi']
-        except KeyError as ke:
-            logging.error(ke)
-            raise ke
-
     def add_order_callback(self, callback):
         """ adds a callback that will be notified of all orders
         seen in the feed for this account """
@@ -83,27 +102,42 @@ class GDAXWebsocketClient(WebsocketFeedListener):
 
     def reset_book(self):
         self.initialized = False
-        self._asks = RBTree()
-        self._bids = RBTree()
+        self._asks = SortedDict()
+        self._bids = SortedDict()
+        self._order_index = dict()
+        # increments rarely change, don't ask for them on every reset
+        if not self._increments_known:
+            self.set_increments()
         res = self.authclient.get_product_order_book(product_id=self.products[0], level=3)
         for bid in res['bids']:
             self.add({
                 'id': bid[2],
                 'side': 'buy',
-                'price': Decimal(bid[0]),
-                'size': Decimal(bid[1])
+                'price': bid[0],
+                'size': bid[1]
             })
         for ask in res['asks']:
             self.add({
                 'id': ask[2],
                 'side': 'sell',
-                'price': Decimal(ask[0]),
-                'size': Decimal(ask[1])
+                'price': ask[0],
+                'size': ask[1]
             })
         self._sequence = res['sequence']
         self.initialized = True
         self.notify_listeners('initialized')
 
+    def set_increments(self):
+        """ sets the decimal places of the price and size ticks from
+        the product's quote and base increments """
+        for product in self.get_products():
+            if product['id'] == self.products[0]:
+                self._price_places = increment_places(product['quote_increment'])
+                self._size_places = increment_places(product['base_increment'])
+                self._price_ticks = price_parser(self._price_places)
+                self._increments_known = True
+                return
+
     def add_listener(self, cb, event):
         """ adds this listener to the event callbacks """
         self.event_listeners[event].append(cb)
@@ -114,25 +148,25 @@ class GDAXWebsocketClient(WebsocketFeedListener):
             cb(event)
 
     def init_bar(self):
-        self.high_price = MIN_EMIN
-        self.low_price = MAX_EMAX
+        self.high_price = float('-inf')
+        self.low_price = float('inf')
         self.open_price = None
         self.close_price = None
         self.prev_close_price = None
-        self.volume = Decimal(0)
+        self.volume = 0
 
     def get_bar(self):
         if self.close_price is None:
             self.close_price = self.prev_close_price
-        if self.high_price == MIN_EMIN:
+        if self.high_price == float('-inf'):
             self.high_price = self.close_price
-        if self.low_price == MAX_EMAX:
+        if self.low_price == float('inf'):
             self.low_price = self.close_price
-        bar = {'open': self.open_price,
-               'high': self.high_price,
-               'low': self.low_price,
-               'close': self.close_price,
-               'volume': self.volume}
+        bar = {'open': self.from_ticks(self.open_price),
+               'high': self.from_ticks(self.high_price),
+               'low': self.from_ticks(self.low_price),
+               'close': self.from_ticks(self.close_price),
+               'volume': from_units(self.volume, self._size_places)}
         self.prev_close_price = self.close_price
         self.init_bar()
         return bar
@@ -160,44 +194,47 @@ class GDAXWebsocketClient(WebsocketFeedListener):
             for _ in self.order_callbacks:
                 _(msg)
 
-        if msg['type'] == 'error':
-            logging.error(msg['message'])
-        elif msg['type'] == 'subscriptions':
-            logging.info('Subscriptions')
-            for _ in msg['channels']:
-                logging.info('%s - products: %s', _['name'],
-                             ",".join(_['product_ids']))
-        elif msg['type'] == 'heartbeat':
-            # can check for missed messages? or does sequence handle this?
-            pass
-        elif msg['type'] == 'match':
-            self.match(msg)
-            self._current_ticker = msg
-            # bar processing
-            self.close_price = Decimal(msg['price'])
-            if self.close_price > self.high_price:
-                self.high_price = self.close_price
-            if self.close_price < self.low_price:
-                self.low_price = self.close_price
-            if self.open_price is None:
-                self.open_price = self.close_price
-            self.volume += Decimal(msg['size'])
-        elif msg['type'] == 'open':
-            self.add(msg)
-        elif msg['type'] == 'done' and 'price' in msg:
-            self.remove(msg)
-        elif msg['type'] == 'change':
-            self.change(msg)
-        elif msg['type'] in ['received', 'ticker']:
-            # we'll ignore these for now
-            pass
-        elif msg['type'] == 'done' and 'price' not in msg:
-            pass
-        else:
+        handler = self._HANDLERS.get(msg['type'])
+        if handler is None:
             logging.debug(msg['type'])
+        else:
+            handler(self, msg)
         if sequence is not None:
             self._sequence = sequence
 
+    def _on_error(self, msg):
+        logging.error(msg['message'])
+
+    def _on_subscriptions(self, msg):
+        logging.info('Subscriptions')
+        for _ in msg['channels']:
+            logging.info('%s - products: %s', _['name'],
+                         ",".join(_['product_ids']))
+
+    def _on_match(self, msg):
+        size = self.match(msg)
+        self._current_ticker = msg
+        # bar processing
+        price = self._price_ticks(msg['price'])
+        self.close_price = price
+        if price > self.high_price:
+            self.high_price = price
+        if price < self.low_price:
+            self.low_price = price
+        if self.open_price is None:
+            self.open_price = price
+        self.volume += size
+
+    def _on_done(self, msg):
+        # done messages without a price were never on the book
+        if 'price' in msg:
+            self.remove(msg)
+
+    def _ignore(self, msg):
+        # heartbeats can check for missed messages? or does sequence
+        # handle this? the rest we'll ignore for now
+        pass
+
     def on_sequence_gap(self, gap_start, gap_end):
         self.reset_book()
         logging.error('messages missing (%s - %s). Re-initializing  book at sequence: %s',
@@ -207,153 +244,101 @@ class GDAXWebsocketClient(WebsocketFeedListener):
         order = {
             'id': order.get('order_id') or order['id'],
             'side': order['side'],
-            'price': Decimal(order['price']),
-            'size': Decimal(order.get('size') or order['remaining_size'])
+            'price': self._price_ticks(order['price']),
+            'size': to_units(order.get('size') or order['remaining_size'],
+                             self._size_places)
         }
-        if order['side'] == 'buy':
-            bids = self.get_bids(order['price'])
-            if bids is None:
-                bids = [order]
-            else:
-                bids.append(order)
-            self.set_bids(order['price'], bids)
-        else:
-            asks = self.get_asks(order['price'])
-            if asks is None:
-                asks = [order]
-            else:
-                asks.append(order)
-            self.set_asks(order['price'], asks)
+        book = self._bids if order['side'] == 'buy' else self._asks
+        level = book.get(order['price'])
+        if level is None:
+            level = book[order['price']] = PriceLevel()
+        level.orders[order['id']] = order
+        level.size += order['size']
+        self._order_index[order['id']] = order
 
     def remove(self, order):
-        price = Decimal(order['price'])
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is not None:
-                bids = [o for o in bids if o['id'] != order['order_id']]
-                if len(bids) > 0:
-                    self.set_bids(price, bids)
-                else:
-                    self.remove_bids(price)
+        order = self._order_index.pop(order['order_id'], None)
+        if order is None:
+            return
+        book = self._bids if order['side'] == 'buy' else self._asks
+        level = book[order['price']]
+        del level.orders[order['id']]
+        if level.orders:
+            level.size -= order['size']
         else:
-            asks = self.get_asks(price)
-            if asks is not None:
-                asks = [o for o in asks if o['id'] != order['order_id']]
-                if len(asks) > 0:
-                    self.set_asks(price, asks)
-                else:
-                    self.remove_asks(price)
+            del book[order['price']]
 
     def match(self, order):
-        size = Decimal(order['size'])
-        price = Decimal(order['price'])
-
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if not bids:
-                return
-            assert bids[0]['id'] == order['maker_order_id']
-            if bids[0]['size'] == size:
-                self.set_bids(price, bids[1:])
-            else:
-                bids[0]['size'] -= size
-                self.set_bids(price, bids)
+        """ fills the resting maker order, returns the size matched in
+        units so callers don't parse it again """
+        size = to_units(order['size'], self._size_places)
+        maker = self._order_index.get(order['maker_order_id'])
+        if maker is None:
+            return size
+        book = self._bids if maker['side'] == 'buy' else self._asks
+        level = book[maker['price']]
+        assert next(iter(level.orders)) == maker['id']
+        if maker['size'] == size:
+            self.remove({'order_id': maker['id']})
         else:
-            asks = self.get_asks(price)
-            if not asks:
-                return
-            assert asks[0]['id'] == order['maker_order_id']
-            if asks[0]['size'] == size:
-                self.set_asks(price, asks[1:])
-            else:
-                asks[0]['size'] -= size
-                self.set_asks(price, asks)
+            maker['size'] -= size
+            level.size -= size
+        return size
 
     def change(self, order):
         try:
-            new_size = Decimal(order['new_size'])
+            new_size = to_units(order['new_size'], self._size_places)
         except KeyError:
             return
 
-        try:
-            price = Decimal(order['price'])
-        except KeyError:
-            return
-
-        if order['side'] == 'buy':
-            bids = self.get_bids(price)
-            if bids is None or not any(o['id'] == order['order_id'] for o in bids):
-                return
-            index = [b['id'] for b in bids].index(order['order_id'])
-            bids[index]['size'] = new_size
-            self.set_bids(price, bids)
-        else:
-            asks = self.get_asks(price)
-            if asks is None or not any(o['id'] == order['order_id'] for o in asks):
-                return
-            index = [a['id'] for a in asks].index(order['order_id'])
-            asks[index]['size'] = new_size
-            self.set_asks(price, asks)
-
-        tree = self._asks if order['side'] == 'sell' else self._bids
-        node = tree.get(price)
-
-        if node is None or not any(o['id'] == order['order_id'] for o in node):
+        # market orders aren't on the book
+        existing = self._order_index.get(order.get('order_id'))
+        if existing is None:
             return
+        book = self._bids if existing['side'] == 'buy' else self._asks
+        book[existing['price']].size += new_size - existing['size']
+        existing['size'] = new_size
 
     def get_current_ticker(self):
         return self._current_ticker
 
+    def from_ticks(self, price):
+        """ a price in ticks back to a Decimal, None is passed through """
+        if price is None:
+            return None
+        return from_units(price, self._price_places)
+
     def get_current_book(self):
-        result = {
+        from_ticks, places = self.from_ticks, self._size_places
+        return {
             'sequence': self._sequence,
-            'asks': [],
-            'bids': [],
+            'asks': [[from_ticks(o['price']), from_units(o['size'], places), o['id']]
+                     for level in self._asks.values()
+                     for o in level.orders.values()],
+            'bids': [[from_ticks(o['price']), from_units(o['size'], places), o['id']]
+                     for level in self._bids.values()
+                     for o in level.orders.values()],
         }
-        for ask in self._asks:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_ask = self._asks[ask]
-            except KeyError:
-                continue
-            for order in this_ask:
-                result['asks'].append([order['price'], order['size'], order['id']])
-        for bid in self._bids:
-            try:
-                # There can be a race condition here, where a price point is removed
-                # between these two ops
-                this_bid = self._bids[bid]
-            except KeyError:
-                continue
-
-            for order in this_bid:
-                result['bids'].append([order['price'], order['size'], order['id']])
-        return result
 
     def get_ask(self):
-        return self._asks.min_key()
+        """ the best ask, raises ValueError if there are no asks """
+        try:
+            return self.from_ticks(self._asks.peekitem(0)[0])
+        except IndexError:
+            raise ValueError('no asks in the book') from None
 
     def get_asks(self, price):
-        return self._asks.get(price)
-
-    def remove_asks(self, price):
-        self._asks.remove(price)
-
-    def set_asks(self, price, asks):
-        self._asks.insert(price, asks)
+        return self._asks.get(self._price_ticks(price))
 
     def get_bid(self):
-        return self._bids.max_key()
+        """ the best bid, raises ValueError if there are no bids """
+        try:
+            return self.from_ticks(self._bids.peekitem(-1)[0])
+        except IndexError:
+            raise ValueError('no bids in the book') from None
 
     def get_bids(self, price):
-        return self._bids.get(price)
-
-    def remove_bids(self, price):
-        self._bids.remove(price)
-
-    def set_bids(self, price, bids):
-        self._bids.insert(price, bids)
+        return self._bids.get(self._price_ticks(price))
 
     def get_bars(self, pair, qty, granularity=60, end=None):
         """ get qty granularity second bars for pair
@@ -363,4 +348,15 @@ class GDAXWebsocketClient(WebsocketFeedListener):
         end -- the end time for the bars, in utc """
         end = end or datetime.datetime.utcnow()
         start = end - datetime.timedelta(seconds=qty * granularity)
-        return data.get_bars(pair, start, end, granularity)
+        return data.get_bars(pair, start, end, granularity, assume_utc=True)
+
+    # message type -> handler, looked up once per message
+    _HANDLERS = {'error': _on_error,
+                 'subscriptions': _on_subscriptions,
+                 'match': _on_match,
+                 'open': add,
+                 'done': _on_done,
+                 'change': change,
+                 'heartbeat': _ignore,
+                 'received': _ignore,
+                 'ticker': _ignore}
@@ -0,0 +1,60 @@
+"""
+File: indicators.py
+Author: Matthew Wright
+Email: matt@wrighters.net
+Github: https://github.com/wrighter
+Description:  Indicators that can be updated one value at a time
+"""
+
+class EMA(object):
+    """ Exponential moving average over a span, updated incrementally.
+    Matches pandas' ewm(span=span).mean() (adjust=True), so it can be
+    seeded from historical bars and then fed new closes as they arrive.
+    """
+    __slots__ = ('decay', '_num', '_den', 'value')
+
+    def __init__(self, span):
+        self.decay = 1 - 2 / (span + 1)
+        self._num = 0.0
+        self._den = 0.0
+        self.value = None
+
+    def update(self, price):
+        """ include the next price, returning the new average """
+        self._num = price + self.decay * self._num
+        self._den = 1 + self.decay * self._den
+        self.value = self._num / self._den
+        return self.value
+
+    def update_many(self, prices):
+        """ include a sequence of prices in order, returning the
+        new average """
+        decay, num, den = self.decay, self._num, self._den
+        for price in prices:
+            num = price + decay * num
+            den = 1 + decay * den
+        self._num, self._den = num, den
+        if den:
+            self.value = num / den
+        return self.value
+
+    def update_pair(self, other, prices):
+        """ include a sequence of prices in this and another ema, e.g. the
+        fast and slow averages of a MACD, in a single pass over the prices,
+        returning both new averages
+        other -- the other EMA
+        prices -- the prices, in order
+        """
+        decay1, num1, den1 = self.decay, self._num, self._den
+        decay2, num2, den2 = other.decay, other._num, other._den
+        for price in prices:
+            num1 = price + decay1 * num1
+            den1 = 1 + decay1 * den1
+            num2 = price + decay2 * num2
+            den2 = 1 + decay2 * den2
+        self._num, self._den = num1, den1
+        other._num, other._den = num2, den2
+        if den1:
+            self.value = num1 / den1
+            other.value = num2 / den2
+        return self.value, other.value
@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+import io
+
+import aiohttp
+import pandas as pd
+import pytest
+import yarl
+
+from blockhead.gdax import data
+from blockhead.gdax.data import parse_config
+
+CONFIG = """
+[keys]
+key = k
+secret = s
+passphrase = p
+
+[uris]
+api = https://api.gdax.com
+wsapi = wss://ws-feed.gdax.com
+"""
+
+def test_parse_config():
+    cfg = parse_config(io.StringIO(CONFIG))
+    assert cfg.api_key == 'k'
+    assert cfg.api_secret == 's'
+    assert cfg.api_passphrase == 'p'
+    assert cfg.api == 'https://api.gdax.com'
+    assert cfg.url == 'wss://ws-feed.gdax.com'
+
+def test_session_per_loop():
+    async def get_sessions(close):
+        session = data.get_session()
+        assert data.get_session() is session
+        assert not session.closed
+        if close:
+            await data.close_session()
+            assert session.closed
+        return session
+
+    first = asyncio.run(get_sessions(close=False))
+    # the first loop is closed, its session can't be reused
+    second = asyncio.run(get_sessions(close=True))
+    assert second is not first
+    asyncio.run(first.close())
+
+def test_fetch_bars_raises_on_error(monkeypatch):
+    fetched = []
+    async def fetch_bar_batch(pair, start, end, interval, client):
+        if not fetched:
+            fetched.append((start, end))
+            url = yarl.URL('https://api.gdax.com/products/ETH-USD/candles')
+            info = aiohttp.RequestInfo(url, 'GET', {}, url)
+            raise aiohttp.ClientResponseError(info, (), status=500, message='boom')
+        await asyncio.sleep(0.1)
+        fetched.append((start, end))
+        index = pd.date_range(start, end, freq='60s')
+        return pd.DataFrame({'close': 1.0}, index=index)
+    monkeypatch.setattr(data, 'fetch_bar_batch', fetch_bar_batch)
+
+    start = datetime.datetime(2018, 1, 3, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(hours=20)
+    # the other windows are cancelled rather than leaving a hole
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(data.fetch_bars('ETH-USD', start, end, 60, client=object(),
+                                    min_interval=0))
+    assert len(fetched) == 1
+
+    bars = asyncio.run(data.fetch_bars('ETH-USD', start, end, 60, client=object(),
+                                       min_interval=0))
+    assert len(bars) == 20 * 60 + 1
+    assert bars.index.is_unique
+
+def make_day(day):
+    """ one utc day of minute bars, with second resolution times like
+    fetch_bar_batch makes """
+    open_time = pd.date_range(day, periods=1440, freq='60s', tz='UTC',
+                              unit='s')
+    return pd.DataFrame({'open_time': open_time, 'low': 1.0, 'high': 2.0,
+                         'open': 1.5, 'close': 1.5, 'volume': 10.0,
+                         'close_time': open_time + pd.Timedelta(seconds=60)})
+
+def test_get_bars_mixed_cache(tmp_path):
+    path = tmp_path / 'ETH-USD' / '60'
+    path.mkdir(parents=True)
+    make_day('2018-01-03').to_csv(path / '2018-01-03', index=False)
+    make_day('2018-01-04').to_parquet(path / '2018-01-04.parquet',
+                                      engine='pyarrow', index=False)
+
+    start = datetime.datetime(2018, 1, 3, 12)
+    end = datetime.datetime(2018, 1, 4, 12)
+    bars = data.get_bars('ETH-USD', start, end, 60, directory=str(tmp_path),
+                         assume_utc=True)
+    assert len(bars) == 24 * 60 + 1
+    assert bars.index.is_monotonic_increasing
+    for col in ['open_time', 'close_time']:
+        assert bars[col].dtype == data.BAR_TIME_DTYPE
+    assert bars.index.dtype == data.BAR_TIME_DTYPE
+
+def test_fetch_bars_public_client(monkeypatch):
+    clients = []
+    async def fetch_candles(pair, start, end, interval, client):
+        clients.append(client)
+        # newest first, as gdax sends them
+        return [[start.timestamp() + 60, 1, 2, 1.5, 1.5, 10],
+                [start.timestamp(), 1, 2, 1.5, 1.5, 10]]
+    monkeypatch.setattr(data, 'fetch_candles', fetch_candles)
+
+    start = datetime.datetime(2018, 1, 3, tzinfo=datetime.timezone.utc)
+    bars = asyncio.run(data.fetch_bars('ETH-USD', start,
+                                       start + datetime.timedelta(minutes=2), 60))
+    assert clients == [data.PUBLIC_CLIENT]
+    assert list(bars['close_time']) == [start + datetime.timedelta(minutes=1),
+                                        start + datetime.timedelta(minutes=2)]
+    assert bars['close_time'].dtype == data.BAR_TIME_DTYPE
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from blockhead.indicators import EMA
+
+def test_ema_matches_pandas():
+    closes = np.random.RandomState(0).uniform(100, 200, 500)
+    expected = pd.Series(closes).ewm(span=26).mean()
+
+    ema = EMA(26)
+    ema.update_many(closes[:400])
+    assert np.isclose(ema.value, expected.iloc[399])
+    for close in closes[400:]:
+        ema.update(close)
+    assert np.isclose(ema.value, expected.iloc[-1])
+
+def test_update_pair():
+    closes = np.random.RandomState(1).uniform(100, 200, 390)
+    fast, slow = EMA(12), EMA(26)
+    assert fast.update_pair(slow, closes) == (fast.value, slow.value)
+    assert np.isclose(fast.value, pd.Series(closes).ewm(span=12).mean().iloc[-1])
+    assert np.isclose(slow.value, pd.Series(closes).ewm(span=26).mean().iloc[-1])
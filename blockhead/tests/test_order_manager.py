@@ -0,0 +1,92 @@
+import asyncio
+from decimal import Decimal
+
+from blockhead.gdax.order_manager import Order, OrderManager, SimpleStrategy
+
+class TickData:
+    """ just enough of TickData for an OrderManager """
+    initialized = True
+    authtrader = None
+
+    def add_listener(self, cback, event):
+        self.on_init = cback
+
+    def add_order_callback(self, callback):
+        pass
+
+def test_handle_order_update():
+    order = Order(Decimal('1.5'), 'ETH-USD', None)
+
+    assert order.handle_order_update({'type': 'received'}) == 0
+    assert order.state == 'received'
+    assert order.handle_order_update({'type': 'open'}) == 0
+    assert order.state == 'open'
+
+    filled = order.handle_order_update({'type': 'match', 'size': '0.5',
+                                        'side': 'buy'})
+    assert filled == Decimal('0.5')
+    assert order.outstanding() == Decimal('1.0')
+
+    assert order.handle_order_update({'type': 'done', 'reason': 'filled'}) == 0
+    assert order.state == 'done'
+
+def test_handle_sell_match():
+    order = Order(Decimal('-2'), 'ETH-USD', None)
+    filled = order.handle_order_update({'type': 'match', 'size': '2.000001',
+                                        'side': 'sell'})
+    assert filled == Decimal('-2.000001')
+    assert order.filled == Decimal('2.000001')
+
+def test_pending_strategies_init_on_initialized():
+    class Strategy:
+        def __init__(self):
+            self.omgr = None
+        async def init(self, omgr):
+            self.omgr = omgr
+
+    tickdata = TickData()
+    tickdata.initialized = False
+    omgr = OrderManager(tickdata, 'ETH-USD')
+    strategies = [Strategy(), Strategy()]
+    for strat in strategies:
+        asyncio.run(omgr.add_strategy(strat))
+    assert omgr.pending_strategies == strategies
+
+    asyncio.run(tickdata.on_init('initialized'))
+    assert omgr.pending_strategies == []
+    assert all(strat.omgr is omgr for strat in strategies)
+
+def test_handle_order_update_lookup():
+    omgr = OrderManager(TickData(), 'ETH-USD')
+    order = Order(Decimal('1'), 'ETH-USD', omgr)
+    omgr.order_lookup[order.client_oid] = order
+    omgr.order_lookup['abc'] = order
+
+    # our order is the taker, the maker is someone else's
+    asyncio.run(omgr.handle_order_update({'type': 'match', 'size': '0.25',
+                                          'side': 'buy',
+                                          'maker_order_id': 'other',
+                                          'taker_order_id': 'abc'}))
+    assert omgr.inventory == Decimal('0.25')
+    assert omgr.inventory_units == 25000000
+    assert order.filled == Decimal('0.25')
+
+    # unknown orders are ignored
+    asyncio.run(omgr.handle_order_update({'type': 'done', 'order_id': 'other'}))
+    assert order.state == 'initial'
+
+def test_inventory_and_outstanding_units():
+    omgr = OrderManager(TickData(), 'ETH-USD')
+    omgr.inventory = Decimal('0.5')
+    assert omgr.inventory_units == 50000000
+
+    strat = SimpleStrategy(Decimal('1.5'))
+    strat.omgr = omgr
+    strat.order = strat.make_order(strat.size)
+    omgr.strategies = [strat]
+    asyncio.run(omgr.handle_order_update({'type': 'match', 'size': '0.25',
+                                          'side': 'buy',
+                                          'client_oid': strat.order.client_oid}))
+    assert omgr.inventory == Decimal('0.75')
+    assert omgr.total_outstanding_units() == 125000000
+    assert omgr.total_outstanding() == Decimal('1.25')
@@ -0,0 +1,64 @@
+import asyncio
+import functools
+
+from collections import defaultdict
+
+from blockhead.gdax.tick_data import Bar, TickData
+from blockhead.util import to_units
+
+def test_bar():
+    bar = Bar()
+    for price, size in [('10.5', '0.1'), ('11', '0.2'), ('9.25', '1')]:
+        bar.handle_close(float(price), to_units(size))
+    assert bar.get_bar() == {'open': 10.5, 'high': 11.0, 'low': 9.25,
+                             'close': 9.25, 'volume': 1.3}
+
+def test_empty_bar_uses_prev_close():
+    bar = Bar()
+    bar.prev_close_price = 12.0
+    assert bar.get_bar() == {'open': None, 'high': 12.0, 'low': 12.0,
+                             'close': 12.0, 'volume': 0.0}
+
+def test_bar_volume_is_correctly_rounded():
+    # 3 * 1e-8 is 3.0000000000000004e-08
+    bar = Bar()
+    bar.handle_close(10.0, 3)
+    assert bar.get_bar()['volume'] == 3e-08
+
+def make_tickdata():
+    """ a TickData without the Trader, which needs a running loop """
+    tickdata = TickData.__new__(TickData)
+    tickdata.event_listeners = defaultdict(list)
+    tickdata.order_callbacks = list()
+    return tickdata
+
+def test_notify_listeners():
+    tickdata = make_tickdata()
+    seen = []
+
+    async def on_event(tag, event):
+        await asyncio.sleep(0)
+        seen.append((tag, event))
+
+    async def on_coro(event):
+        await on_event('coro', event)
+
+    tickdata.add_listener(on_coro, 'initialized')
+    tickdata.add_listener(functools.partial(on_event, 'partial'), 'initialized')
+    tickdata.add_listener(lambda event: seen.append(('plain', event)), 'initialized')
+    asyncio.run(tickdata.notify_listeners('initialized'))
+    asyncio.run(tickdata.notify_listeners('unknown'))
+    assert sorted(seen) == [('coro', 'initialized'), ('partial', 'initialized'),
+                            ('plain', 'initialized')]
+
+def test_notify_order_listeners():
+    tickdata = make_tickdata()
+    seen = []
+
+    async def on_order(tag, msg):
+        seen.append((tag, msg['order_id']))
+
+    tickdata.add_order_callback(functools.partial(on_order, 'partial'))
+    tickdata.add_order_callback(lambda msg: on_order('lambda', msg))
+    asyncio.run(tickdata.notify_order_listeners({'order_id': 'a'}))
+    assert sorted(seen) == [('lambda', 'a'), ('partial', 'a')]
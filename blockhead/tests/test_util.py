@@ -1,6 +1,10 @@
 import datetime
+from decimal import Decimal
 
-from blockhead.util import to_utc, to_local
+import tzlocal
+
+from blockhead import util
+from blockhead.util import to_utc, to_local, to_units, from_units
 
 def test_to_utc():
     now = datetime.datetime(2018, 1, 3, 14, 15)
@@ -9,3 +13,37 @@ def test_to_utc():
 
     assert now1 - utc1 == datetime.timedelta(0)
     assert utc1.tzname() == 'UTC'
+
+def test_to_units():
+    assert to_units('0.01000000') == 1000000
+    assert to_units('12') == 1200000000
+    assert to_units('-0.5') == -50000000
+    assert to_units('1.123456789') == 112345678
+    assert to_units('3.25', places=2) == 325
+    assert to_units(Decimal('1E-8')) == 1
+    assert to_units(0.1) == 10000000
+
+def test_from_units():
+    assert from_units(1000000) == Decimal('0.01')
+    assert from_units(325, places=2) == Decimal('3.25')
+    assert from_units(to_units('-7.00000001')) == Decimal('-7.00000001')
+
+def test_to_utc_assume_utc():
+    now = datetime.datetime(2018, 1, 3, 14, 15)
+    utc = to_utc(now, assume_utc=True)
+    assert utc.tzname() == 'UTC'
+    assert utc.replace(tzinfo=None) == now
+    assert to_utc(utc) is utc
+
+def test_local_timezone(monkeypatch):
+    monkeypatch.setattr(tzlocal, 'get_localzone_name', lambda: 'Europe/Berlin')
+    berlin = util._local_timezone()
+    assert datetime.datetime(2018, 1, 3, tzinfo=berlin).utcoffset() == \
+        datetime.timedelta(hours=1)
+
+def test_local_timezone_fallback(monkeypatch):
+    monkeypatch.setattr(tzlocal, 'get_localzone_name', lambda: None)
+    assert util._local_timezone() is datetime.timezone.utc
+
+    monkeypatch.setattr(tzlocal, 'get_localzone_name', lambda: 'Not/AZone')
+    assert util._local_timezone() is datetime.timezone.utc
@@ -0,0 +1,142 @@
+import io
+import sys
+import types
+from decimal import Decimal
+
+import pytest
+
+# the installed gdax package has no websocket listener, stand one in so
+# the client's book handling can be tested without a connection
+class WebsocketFeedListener(object):
+    def __init__(self, products=None, **kwargs):
+        self.products = products
+
+_LISTENER = types.ModuleType('gdax.websocket_feed_listener')
+_LISTENER.WebsocketFeedListener = WebsocketFeedListener
+sys.modules.setdefault('gdax.websocket_feed_listener', _LISTENER)
+
+from blockhead.gdax import ws_client
+
+CONFIG = """
+[keys]
+key = k
+secret = s
+passphrase = p
+
+[uris]
+api = https://api.gdax.com
+wsapi = wss://ws-feed.gdax.com
+"""
+
+class FakeAuthClient(object):
+    """ answers the rest calls made when resetting the book """
+    def __init__(self, *args):
+        self.product_calls = 0
+
+    def get_products(self):
+        self.product_calls += 1
+        return [{'id': 'BTC-USD', 'quote_increment': '0.01',
+                 'base_increment': '0.00000001'},
+                {'id': 'ETH-USD', 'quote_increment': '0.01000000',
+                 'base_increment': '0.00010000'}]
+
+    def get_product_order_book(self, product_id, level):
+        return {'sequence': 10,
+                'bids': [['10.00', '1.5', 'b1'], ['9.50', '2', 'b2']],
+                'asks': [['10.50', '1', 'a1']]}
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(ws_client, 'AuthenticatedClient', FakeAuthClient,
+                        raising=False)
+    client = ws_client.GDAXWebsocketClient(io.StringIO(CONFIG), ['ETH-USD'],
+                                           False, ['full'])
+    client.on_open()
+    return client
+
+def test_increment_places():
+    assert ws_client.increment_places('0.01000000') == 2
+    assert ws_client.increment_places('1') == 0
+    assert ws_client.increment_places('0.00000001') == 8
+
+def test_reset_book(client):
+    client.reset_book()
+    assert client._sequence == 10
+    assert client._price_places == 2
+    assert client._size_places == 4
+    assert client.get_bid() == Decimal('10.00')
+    assert client.get_ask() == Decimal('10.50')
+    assert client.get_current_book()['bids'] == [
+        [Decimal('9.50'), Decimal('2'), 'b2'],
+        [Decimal('10.00'), Decimal('1.5'), 'b1']]
+
+    # the increments are only fetched once
+    client.reset_book()
+    assert client.authclient.product_calls == 1
+
+def test_empty_book(client):
+    with pytest.raises(ValueError):
+        client.get_bid()
+    with pytest.raises(ValueError):
+        client.get_ask()
+
+def test_add_match_done(client):
+    client.add({'id': 'a', 'side': 'buy', 'price': '10.00', 'size': '1'})
+    client.add({'order_id': 'b', 'side': 'buy', 'price': '10.00',
+                'remaining_size': '2'})
+    client.add({'id': 'c', 'side': 'sell', 'price': '11', 'size': '1.5'})
+    assert client.get_bid() == Decimal('10.00')
+    assert client.get_ask() == Decimal('11')
+    level = client.get_bids('10.00000000')
+    assert list(level.orders) == ['a', 'b']
+    assert level.size == ws_client.to_units('3')
+
+    # partial fill of the order at the head of the level
+    size = client.match({'maker_order_id': 'a', 'size': '0.4'})
+    assert size == ws_client.to_units('0.4')
+    assert level.size == ws_client.to_units('2.6')
+    assert level.orders['a']['size'] == ws_client.to_units('0.6')
+
+    # full fill removes it, the next order becomes the head
+    client.match({'maker_order_id': 'a', 'size': '0.6'})
+    assert list(level.orders) == ['b']
+    assert level.size == ws_client.to_units('2')
+
+    # removing the last order removes the level
+    client.remove({'order_id': 'b'})
+    client.remove({'order_id': 'unknown'})
+    assert client.get_bids('10.00') is None
+    with pytest.raises(ValueError):
+        client.get_bid()
+
+def test_change(client):
+    client.add({'id': 'a', 'side': 'sell', 'price': '10.50', 'size': '2'})
+    client.add({'id': 'b', 'side': 'sell', 'price': '10.50', 'size': '1'})
+    client.change({'order_id': 'a', 'new_size': '1.5'})
+    # market orders and changes without a new size are ignored
+    client.change({'order_id': 'm', 'new_size': '1'})
+    client.change({'order_id': 'a', 'new_funds': '5'})
+    level = client.get_asks('10.50')
+    assert level.orders['a']['size'] == ws_client.to_units('1.5')
+    assert level.size == ws_client.to_units('2.5')
+
+def test_on_message(client):
+    client.reset_book()
+    client.on_message({'type': 'open', 'sequence': 11, 'order_id': 'e',
+                       'side': 'sell', 'price': '10.25', 'remaining_size': '2'})
+    client.on_message({'type': 'match', 'sequence': 12, 'maker_order_id': 'e',
+                       'side': 'sell', 'price': '10.25', 'size': '0.5'})
+    client.on_message({'type': 'done', 'sequence': 13, 'order_id': 'b2',
+                       'side': 'buy', 'price': '9.50'})
+    # older messages are ignored
+    client.on_message({'type': 'done', 'sequence': 9, 'order_id': 'b1',
+                       'side': 'buy', 'price': '10.00'})
+    assert client._sequence == 13
+    assert client.get_ask() == Decimal('10.25')
+    assert client.get_asks('10.25').size == ws_client.to_units('1.5', 4)
+    assert [bid[2] for bid in client.get_current_book()['bids']] == ['b1']
+    assert client.get_bar() == {'open': Decimal('10.25'),
+                                'high': Decimal('10.25'),
+                                'low': Decimal('10.25'),
+                                'close': Decimal('10.25'),
+                                'volume': Decimal('0.5')}
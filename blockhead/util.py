@@ -6,18 +6,58 @@ Github: https://github.com/wrighter
 Description:  Generic utility functions
 """
 
-import pytz
+import datetime
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
 import tzlocal
 
+_UTC = datetime.timezone.utc
+
+def _local_timezone():
+    """ the system timezone as a ZoneInfo, falls back to utc when it
+    can't be named, e.g. containers without /etc/timezone. The zone is
+    built here rather than taken from tzlocal, older versions return
+    pytz zones that give the wrong offset with replace() """
+    try:
+        name = tzlocal.get_localzone_name()
+        if name is not None:
+            return ZoneInfo(name)
+    except (LookupError, ValueError, OSError):
+        pass
+    return _UTC
+
+# looked up once, tzlocal reads the system configuration on each call
+_LOCAL_TZ = _local_timezone()
+
 def to_local(date):
     """ localizes to local time zone """
-    local_timezone = tzlocal.get_localzone()
-    return local_timezone.localize(date)
+    return date.replace(tzinfo=_LOCAL_TZ)
 
-def to_utc(date):
+def to_utc(date, assume_utc=False):
     """ converts the datetime to utc, assumes local timezone,
-    will localize offset-naive datetimes to local time """
-    if date.tzinfo is None:
-        date = to_local(date)
-    local_timezone = tzlocal.get_localzone()
-    return date.astimezone(pytz.utc)
+    will localize offset-naive datetimes to local time
+    date -- the datetime to convert
+    assume_utc -- treat offset-naive datetimes as already in utc,
+    e.g. those from datetime.utcnow() """
+    tzinfo = date.tzinfo
+    if tzinfo is _UTC:
+        return date
+    if tzinfo is None:
+        if assume_utc:
+            return date.replace(tzinfo=_UTC)
+        date = date.replace(tzinfo=_LOCAL_TZ)
+    return date.astimezone(_UTC)
+
+def to_units(amount, places=8):
+    """ converts an amount to an integer count of 10 ** -places units.
+    Decimal strings, as sent by gdax, are converted exactly without
+    building a Decimal, digits past places are truncated """
+    if not isinstance(amount, str):
+        return int(Decimal(str(amount)).scaleb(places))
+    whole, _, frac = amount.partition('.')
+    return int(whole + (frac + '0' * places)[:places])
+
+def from_units(units, places=8):
+    """ converts an integer count of 10 ** -places units back to a Decimal """
+    return Decimal(units).scaleb(-places)
@@ -15,11 +15,13 @@ import pathlib
 import datetime
 import asyncio
 
-import gdax
-
-import pandas as pd
 from dateutil import parser
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from blockhead.gdax import data
 from blockhead.util import to_utc
 
@@ -29,8 +31,10 @@ async def main():
     argparser.add_argument('-o', '--output_dir', default='output', help='Directory to save file')
     argparser.add_argument('-d', '--debug', help='enable debug logging', action='store_true')
     argparser.add_argument('-i', '--interval', default=60, help='bar interval in seconds')
-    argparser.add_argument('-q', '--quantity', default=300,
+    argparser.add_argument('-q', '--quantity', default=300, type=int,
                            help='number of bars to fetch at a time')
+    argparser.add_argument('-c', '--concurrency', default=3, type=int,
+                           help='number of requests to have in flight at once')
     argparser.add_argument("--start_date",
                            default=(datetime.datetime.utcnow() - datetime.timedelta(days=1)),
                            help="start datetime")
@@ -59,11 +63,14 @@ async def main():
 
     logging.debug(args)
 
-    # make a client to pass along and keep from instantiating many of these
-    client = gdax.trader.Trader(product_id=args.pair)
-    bars = await data.fetch_bars(args.pair, args.start_date,
-                                 args.end_date,
-                                 args.interval, client, args.quantity)
+    # candles are public, fetch_bars needs no authenticated client
+    try:
+        bars = await data.fetch_bars(args.pair, args.start_date,
+                                     args.end_date,
+                                     args.interval, batch=args.quantity,
+                                     concurrency=args.concurrency)
+    finally:
+        await data.close_session()
     if bars is None:
         logging.warn("No bars fetched")
         sys.exit(1)
@@ -73,17 +80,18 @@ async def main():
     path = pathlib.Path(args.output_dir, args.pair, str(args.interval))
     path.mkdir(parents=True, exist_ok=True)
 
-    dates = pd.unique(bars.index.date)
-    logging.debug("fetched for %s", dates)
-    for date in dates:
-        outfile = path / date.strftime('%Y-%m-%d')
+    # one pass to split the bars by utc day
+    for date, sub in bars.groupby(bars.index.floor('D'), sort=False):
+        outfile = path / date.strftime('%Y-%m-%d.parquet')
         if outfile.exists():
             if outfile.is_file():
                 outfile.rename(outfile.with_suffix('.bak'))
-        sub = bars[bars.index.date == date]
-        sub.to_csv(outfile.open('w'), index=False)
+        sub.to_parquet(str(outfile), engine='pyarrow', compression='snappy',
+                       index=False)
         logging.debug("Wrote %s rows to %s", len(sub), outfile)
 
 if __name__ == '__main__':
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     loop = asyncio.get_event_loop()
     loop.run_until_complete(main())
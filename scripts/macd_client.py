@@ -14,48 +14,81 @@ import datetime
 import traceback
 from decimal import Decimal
 import asyncio
-import pandas as pd
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+from blockhead.gdax import data
+from blockhead.indicators import EMA
 from blockhead.gdax.tick_data import TickData
 from blockhead.gdax.order_manager import OrderManager, Order, FollowStrategy
+from blockhead.util import to_units, from_units
+
+# orders are sized in whole lots of 1e-5, as integer units of 1e-8
+LOT_UNITS = to_units(Order.FIVE_PLACES)
+
+def compute_inventory(accounts, ticker, args):
+    """ returns the total quantity available to trade and the initial
+    inventory, which is only drawn from the account with use_inventory
+    accounts -- the accounts, by currency
+    ticker -- the ticker for the pair
+    args -- the parsed arguments
+    """
+    (first, second) = args.pair.split('-')
+    total_qty = Decimal(accounts[second]['available'])/Decimal(ticker['price'])
+    inventory = Decimal(0)
+    if args.use_inventory:
+        current = Decimal(accounts[first]['available'])
+        inventory = current if current < args.quantity else args.quantity
+        total_qty += current
+    return total_qty, inventory
 
 async def run(loop, args):
     """ run the model """
-    client = TickData(args.config, args.pair,
+    # constants used by the callbacks below, bound once
+    pair = args.pair
+    window = args.lookback * 26
+    client = TickData(args.config, pair,
                       timeout_sec=args.timeout)
 
-    products = await client.get_products()
-    product_map = dict(zip([_['id'] for _ in products], products))
-    if args.pair not in product_map:
+    # the startup requests don't depend on each other
+    products, ticker, accounts, bars = await asyncio.gather(
+        client.get_products(),
+        client.get_product_ticker(pair),
+        client.get_account(''),
+        client.get_bars(pair, window),
+        return_exceptions=True)
+    for name, res in (('products', products), ('ticker', ticker),
+                      ('accounts', accounts), ('bars', bars)):
+        if isinstance(res, Exception):
+            logging.error("failed to get %s: %s", name, res)
+            raise res
+
+    if not any(_['id'] == pair for _ in products):
         logging.error("Pair not found in products")
         sys.exit(1)
 
-    ordermanager = OrderManager(client, args.pair)
+    ordermanager = OrderManager(client, pair)
     await ordermanager.init()
     logging.debug(ordermanager)
 
-    ticker = await client.get_product_ticker(args.pair)
-
     if ticker:
-        logging.info("got ticker for %s, %s", args.pair, ticker)
+        logging.info("got ticker for %s, %s", pair, ticker)
     else:
         logging.error("failed to get ticker: %s", ticker)
         sys.exit(1)
 
-    accounts = await client.get_account('')
-    accounts = dict(zip([_['currency'] for _ in accounts], accounts))
-    (first, second) = args.pair.split('-')
+    accounts = {_['currency']: _ for _ in accounts}
+    (first, second) = pair.split('-')
     logging.info("You have %s %s", first, accounts[first]['available'])
     logging.info("You have %s %s", second, accounts[second]['available'])
 
     # assume that quantity is first in pair, and that we need
     # at least that amount in the pair on either side to run
     if args.quantity:
-        total_qty = Decimal(accounts[second]['available'])/Decimal(ticker['price'])
-        if args.use_inventory:
-            current = Decimal(accounts[first]['available'])
-            ordermanager.inventory = current.min(args.quantity)
-            total_qty += current
+        total_qty, ordermanager.inventory = compute_inventory(accounts, ticker, args)
         if total_qty < args.quantity:
             logging.error('Insufficient funds, exiting')
             sys.exit(1)
@@ -65,101 +98,113 @@ async def run(loop, args):
                          second, accounts[second]['available'])
             logging.info("Initial inventory is %s", ordermanager.inventory)
 
-    bars = await client.get_bars(args.pair, args.lookback * 26)
+    # the emas are seeded from history, then updated with each new bar
+    ema1 = EMA(12 * args.lookback)
+    ema2 = EMA(26 * args.lookback)
+    ema1.update_pair(ema2, bars['close'].tolist())
+    last_close = bars['close'].iloc[-1]
 
     logging.debug("starting ws client")
 
+    # sizes on the update path are integer units, see util.to_units
+    quantity_units = to_units(args.quantity)
+
     # TODO
     # decide on whether to place an order or not on indicator update
     # decide on price to pay
     # place order and add to order list
     # see the order show up in the feed
-    def do_indicator(bars):
+    def do_indicator(close):
         """ handle updates """
-        # XXX move to just doing emas on our own instead of a growing dataframe
-        ema1 = bars['close'].ewm(span=12 * args.lookback).mean()[-1]
-        ema2 = bars['close'].ewm(span=26 * args.lookback).mean()[-1]
-        logging.info("close: %s ema1: %s ema2: %s",
-                     bars['close'][-1], ema1, ema2)
-        if ema1 > ema2:
+        fast, slow = ema1.value, ema2.value
+        logging.info("close: %s ema1: %s ema2: %s", close, fast, slow)
+        if fast > slow:
             logging.info("long")
         else:
             logging.info("short")
 
         if client.initialized:
             # TODO, look at sign flips without fills in between
-            if ema1 > ema2:
+            inventory = ordermanager.inventory_units
+            outstanding = ordermanager.total_outstanding_units()
+            if fast > slow:
                 # if long and inventory < quantity, let's buy
-                qty = (Decimal(args.quantity) - ordermanager.inventory)
-                qty -= ordermanager.total_outstanding()
+                qty = quantity_units - inventory - outstanding
                 if qty > 0:
                     asyncio.ensure_future(start_order(loop, qty))
             else:
                 # if short, get rid of any inventory, cannot short
-                if ordermanager.inventory + ordermanager.total_outstanding() > 0:
-                    qty = -ordermanager.inventory
-                    asyncio.ensure_future(start_order(loop, qty))
-            try:
-                logging.info("bid: %s ask: %s",
-                             client.orderbook.get_bid(args.pair),
-                             client.orderbook.get_ask(args.pair))
-            except ValueError as _:
-                logging.info("No book yet")
+                if inventory + outstanding > 0:
+                    asyncio.ensure_future(start_order(loop, -inventory))
+            if logging.root.isEnabledFor(logging.INFO):
+                # the book lookups are only worth doing if they're logged
+                try:
+                    logging.info("bid: %s ask: %s",
+                                 client.orderbook.get_bid(pair),
+                                 client.orderbook.get_ask(pair))
+                except ValueError as _:
+                    logging.info("No book yet")
 
     async def start_order(loop, quantity):
-        """ starts an order strategy """
-        # do one more check on order size
-        quantity = quantity.quantize(Order.FIVE_PLACES)
-        if abs(quantity) > 0:
+        """ starts an order strategy for a signed quantity in units """
+        # do one more check on order size, truncating to whole lots
+        lots = abs(quantity) // LOT_UNITS * LOT_UNITS
+        quantity = from_units(lots if quantity > 0 else -lots)
+        if lots:
             strategy = await ordermanager.add_strategy(FollowStrategy(quantity))
             logging.info("created order for %s", quantity)
-            tdelta = datetime.timedelta(seconds=1,
-                                        microseconds=now.microsecond)
-            loop.call_at(loop.time() + tdelta.total_seconds(), do_order_update,
-                         loop, strategy, client)
+            await poll_strategy(strategy)
         else:
             logging.info("Too small to trade: %s", quantity)
 
-    def do_order_update(loop, strategy, client):
-        """ callback for checking positions """
-        if not strategy.is_complete():
-            asyncio.ensure_future(strategy.update_orders())
-            tdelta = datetime.timedelta(seconds=1,
-                                        microseconds=now.microsecond)
-            loop.call_at(loop.time() + tdelta.total_seconds(),
-                         do_order_update, loop, strategy, client)
-
-    def on_bar(client, bars, loop):
-        """ handles appending bar and updating model """
+    async def poll_strategy(strategy):
+        """ checks positions every second until the strategy completes """
+        next_update = loop.time()
+        while True:
+            # deadlines missed while an update ran long are skipped
+            next_update = max(next_update + 1, loop.time())
+            await asyncio.sleep(next_update - loop.time())
+            if strategy.is_complete():
+                return
+            try:
+                await strategy.update_orders()
+            except Exception as e:
+                logging.error("Failed to update orders: %s", e)
+
+    def on_bar(client, loop, next_bar):
+        """ handles closing the bar and updating model """
         now = datetime.datetime.utcnow()
         if client.initialized:
             current_bar = client.current_bar.get_bar()
-            if current_bar is None:
+            if current_bar is None or current_bar['close'] is None:
                 logging.warning("Bar is invalid")
             else:
-                # append to bars
                 tdelta = datetime.timedelta(seconds=now.second,
                                             microseconds=now.microsecond)
                 close_time = now - tdelta
-                open_time = close_time - datetime.timedelta(minutes=1)
-                current_bar['close_time'] = close_time
-                current_bar['open_time'] = open_time
-                bars = pd.concat([bars, pd.DataFrame(current_bar, index=[close_time])])
 
-                do_indicator(bars)
+                ema1.update(current_bar['close'])
+                ema2.update(current_bar['close'])
+                do_indicator(current_bar['close'])
 
-                logging.info('Recent bar data: %s', bars.tail(2))
-        tdelta = datetime.timedelta(seconds=60-now.second,
-                                    microseconds=now.microsecond)
-        loop.call_at(loop.time() + tdelta.total_seconds(), on_bar,
-                     client, bars, loop)
+                logging.info('Bar %s open: %s high: %s low: %s close: %s volume: %s',
+                             close_time, current_bar['open'], current_bar['high'],
+                             current_bar['low'], current_bar['close'],
+                             current_bar['volume'])
+        # bars stay on the minute set at startup, on the loop's clock
+        next_bar += 60
+        clock = loop.time()
+        if next_bar <= clock:
+            # skip minutes missed during a stall rather than closing
+            # empty bars back to back
+            next_bar += (clock - next_bar) // 60 * 60 + 60
+        loop.call_at(next_bar, on_bar, client, loop, next_bar)
 
-    do_indicator(bars)
+    do_indicator(last_close)
+    # the wall clock is only used once, to find the next minute
     now = datetime.datetime.now()
-    tdelta = datetime.timedelta(seconds=60-now.second,
-                                microseconds=now.microsecond)
-    loop.call_at(loop.time() + tdelta.total_seconds(), on_bar,
-                 client, bars, loop)
+    next_bar = loop.time() + 60 - now.second - now.microsecond / 1e6
+    loop.call_at(next_bar, on_bar, client, loop, next_bar)
 
     await client.run()
 
@@ -193,6 +238,8 @@ def main():
                             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     logging.debug(args)
 
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     loop = asyncio.get_event_loop()
 
     try:
@@ -207,6 +254,7 @@ def main():
                                   limit=2, file=sys.stdout)
         loop.stop()
 
+    loop.run_until_complete(data.close_session())
     loop.close()
 
 if __name__ == '__main__':
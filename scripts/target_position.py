@@ -12,35 +12,53 @@ account. Options to get aggressive or work as a marketable limit order
 import sys
 import logging
 import argparse
-import datetime
 import functools
 from decimal import Decimal
 import asyncio
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from blockhead.gdax.tick_data import TickData
 from blockhead.gdax.order_manager import OrderManager, Order, SimpleStrategy, FollowStrategy
 
-async def run(loop, client, ordermanager, args):
+async def run(loop, args):
     """ main run function, runs until position is obtained or user exits """
-    products = await client.get_products()
-    product_map = dict(zip([_['id'] for _ in products], products))
-    if args.pair not in product_map:
+    # built inside the running loop, so the trader's session and the
+    # order manager's semaphore belong to it
+    client = TickData(args.config, args.pair,
+                      trade_log_file_path=args.tradefile,
+                      timeout_sec=args.timeout)
+    ordermanager = OrderManager(client, args.pair)
+
+    # the startup requests don't depend on each other
+    products, ticker, accounts = await asyncio.gather(
+        client.get_products(),
+        client.get_product_ticker(args.pair),
+        client.get_account(),
+        return_exceptions=True)
+    for name, res in (('products', products), ('ticker', ticker),
+                      ('accounts', accounts)):
+        if isinstance(res, Exception):
+            logging.error("failed to get %s: %s", name, res)
+            raise res
+
+    if not any(_['id'] == args.pair for _ in products):
         logging.error("Pair not found in products")
         sys.exit(1)
 
     await ordermanager.init()
     logging.debug(ordermanager)
 
-    ticker = await client.get_product_ticker(args.pair)
-
     if ticker:
         logging.info("got ticker for %s, %s", args.pair, ticker)
     else:
         logging.error("failed to get ticker: %s", ticker)
         sys.exit(1)
 
-    accounts = await client.get_account()
-    accounts = dict(zip([_['currency'] for _ in accounts], accounts))
+    accounts = {_['currency']: _ for _ in accounts}
     (first, second) = args.pair.split('-')
     logging.info("You have %s %s", first, accounts[first]['available'])
     logging.info("You have %s %s", second, accounts[second]['available'])
@@ -80,23 +98,24 @@ async def run(loop, client, ordermanager, args):
 
     logging.debug("starting ws client")
 
-    def do_update(loop, strategy, client):
-        """ callback for checking on position status on a timer """
+    def do_update(loop, strategy, client, next_update, update=None):
+        """ callback for checking on position status on a timer
+        update -- the task of the last update, if one was started """
         # XXX check on the order, perhaps update its state?
         if strategy.is_complete():
             logging.debug("All done, exiting")
             client.stop()
-        else:
-            asyncio.ensure_future(strategy.update_orders())
-        td = datetime.timedelta(seconds=1,
-                                microseconds=now.microsecond)
-        loop.call_at(loop.time() + td.total_seconds(), do_update, loop,
-                     strategy, client)
-
-    now = datetime.datetime.now()
-    td = datetime.timedelta(seconds=1, microseconds=now.microsecond)
-    loop.call_at(loop.time() + td.total_seconds(), do_update, loop,
-                 strategy, client)
+        elif update is None or update.done():
+            # a slow update isn't overlapped, this one is skipped instead
+            update = asyncio.ensure_future(strategy.update_orders())
+        # every second on the loop's clock, without drifting, but
+        # deadlines missed during a stall are skipped, not run back to back
+        next_update = max(next_update + 1, loop.time())
+        loop.call_at(next_update, do_update, loop, strategy, client,
+                     next_update, update)
+
+    next_update = loop.time() + 1
+    loop.call_at(next_update, do_update, loop, strategy, client, next_update)
 
     await client.run()
 
@@ -131,17 +150,12 @@ def main():
                             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     logging.debug(args)
 
-
-    client = TickData(args.config, args.pair,
-                      trade_log_file_path=args.tradefile,
-                      timeout_sec=args.timeout)
-
-    ordermanager = OrderManager(client, args.pair)
-
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     loop = asyncio.get_event_loop()
 
     try:
-        loop.run_until_complete(run(loop, client, ordermanager, args))
+        loop.run_until_complete(run(loop, args))
     except KeyboardInterrupt:
         logging.info("Quitting")
         loop.stop()